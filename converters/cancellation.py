@@ -0,0 +1,40 @@
+import time
+import threading
+
+
+class CancellationToken:
+    """协作式取消令牌：转换过程在页面或片段之间检查，到期或被取消后返回已完成的部分结果
+
+    deadline_seconds 为从创建令牌开始计算的时间上限（秒），None 表示不限时。
+    """
+
+    def __init__(self, deadline_seconds=None):
+        self._event = threading.Event()
+        self._reason = None
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + deadline_seconds if deadline_seconds else None
+
+    def cancel(self, reason="cancelled"):
+        """请求取消转换，可以从其他线程或信号处理函数中调用"""
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    def remaining(self):
+        """距离截止时间剩余的秒数，不限时返回 None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def stop_reason(self):
+        """需要停止时返回原因（cancelled 或 deadline），否则返回 None"""
+        if self._event.is_set():
+            return self._reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+            return self._reason
+        return None
+
+    @property
+    def stopped(self):
+        return self.stop_reason() is not None
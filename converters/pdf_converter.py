@@ -1,9 +1,12 @@
 import sys
 import os
 import pdfplumber
-import io
 import re
 
+# 以脚本方式运行时，把项目根目录加入 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from converters.cancellation import CancellationToken
+
 # 中文处理方式说明：
 # 1. 设置标准输出和标准错误的编码为utf-8，解决控制台输出中文乱码问题
 # 2. 使用 pdfplumber 的 extract_text() 方法提取文本，该方法会自动处理中文编码
@@ -11,9 +14,9 @@ import re
 # 4. 使用 errors='ignore' 参数处理无法解码的字符，确保程序不会崩溃
 # 5. 最终输出时使用 encode('utf-8').decode('utf-8') 确保文本格式正确
 
-# 设置标准输出和标准错误的编码为utf-8
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+# 设置标准输出和标准错误的编码为utf-8（原地修改，被 web 服务或测试导入时不替换已有的流对象）
+sys.stdout.reconfigure(encoding='utf-8')
+sys.stderr.reconfigure(encoding='utf-8')
 
 def get_heading_level(font_size, max_font_size):
     """根据字体大小确定标题级别"""
@@ -150,51 +153,347 @@ def process_text_with_formatting(page, output_format='text'):
         
         return '\n'.join(formatted_lines)
 
-def convert_pdf_to_text(pdf_path, output_format='text'):
+# 表格检测参数
+# 线段粗细不超过该值（pt）视为横线或竖线
+RULING_MAX_THICKNESS = 2
+# 线段长度小于该值（pt）不视为表格线，避免散点标记等小图形被当作表格
+RULING_MIN_LENGTH = 10
+# 线段端点之间距离小于该值（pt）视为相连，属于同一个表格区域
+RULING_JOIN_TOLERANCE = 3
+# 表格区域至少需要的不同位置的横线和竖线数量（3 条线构成两行或两列）
+MIN_RULINGS = 3
+# 每页最多对多少个候选区域运行表格识别
+MAX_TABLE_REGIONS = 10
+# 只使用页面中的线条查找单元格
+TABLE_SETTINGS = {
+    "vertical_strategy": "lines",
+    "horizontal_strategy": "lines",
+}
+
+def get_ruling_segments(page):
+    """从页面的 lines/rects 中收集横线和竖线，矩形拆成四条边"""
+    horizontal = []
+    vertical = []
+
+    def add(x0, top, x1, bottom):
+        # 太短的线段多是图表标记或装饰，不当作表格线
+        if bottom - top <= RULING_MAX_THICKNESS and x1 - x0 >= RULING_MIN_LENGTH:
+            horizontal.append((x0, top, x1, bottom))
+        elif x1 - x0 <= RULING_MAX_THICKNESS and bottom - top >= RULING_MIN_LENGTH:
+            vertical.append((x0, top, x1, bottom))
+
+    for obj in page.objects.get('line', []):
+        add(obj['x0'], obj['top'], obj['x1'], obj['bottom'])
+    for obj in page.objects.get('rect', []):
+        x0, top, x1, bottom = obj['x0'], obj['top'], obj['x1'], obj['bottom']
+        if x1 - x0 <= RULING_MAX_THICKNESS or bottom - top <= RULING_MAX_THICKNESS:
+            add(x0, top, x1, bottom)
+        elif obj.get('fill'):
+            # 填充的矩形是色块或散点标记，其边框不是表格线
+            continue
+        else:
+            add(x0, top, x1, top)
+            add(x0, bottom, x1, bottom)
+            add(x0, top, x0, bottom)
+            add(x1, top, x1, bottom)
+
+    return horizontal, vertical
+
+def find_table_regions(page):
+    """用页面线条的几何信息快速找出可能包含有线表格的区域
+
+    只做线段分组，不解析单元格。至少要有 MIN_RULINGS 条位置不同的横线和竖线
+    （即至少两行两列），单个矩形框、页面边框和图表中的小方块都会被排除。
+    没有这些线条的页面直接返回空列表，几乎没有额外开销。
+    """
+    horizontal, vertical = get_ruling_segments(page)
+    if len(horizontal) < MIN_RULINGS or len(vertical) < MIN_RULINGS:
+        return []
+
+    tol = RULING_JOIN_TOLERANCE
+    segments = sorted(horizontal + vertical, key=lambda seg: seg[1])
+    parent = list(range(len(segments)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # 按 top 扫描，只和垂直方向上仍可能接触的线段比较，避免两两比较
+    active = []
+    for i, (x0, top, x1, bottom) in enumerate(segments):
+        active = [j for j in active if segments[j][3] + tol >= top]
+        for j in active:
+            if segments[j][0] - tol <= x1 and x0 <= segments[j][2] + tol:
+                parent[find(i)] = find(j)
+        active.append(i)
+
+    # 汇总每组的外框和不同位置的横线、竖线
+    groups = {}
+    for i, (x0, top, x1, bottom) in enumerate(segments):
+        group = groups.setdefault(find(i), [x0, top, x1, bottom, set(), set()])
+        group[0] = min(group[0], x0)
+        group[1] = min(group[1], top)
+        group[2] = max(group[2], x1)
+        group[3] = max(group[3], bottom)
+        if bottom - top <= RULING_MAX_THICKNESS:
+            group[4].add(round(top))
+        else:
+            group[5].add(round(x0))
+
+    regions = [
+        tuple(group[:4]) for group in groups.values()
+        if len(group[4]) >= MIN_RULINGS and len(group[5]) >= MIN_RULINGS
+    ]
+    # 限制每页候选区域的数量，优先保留面积大的区域
+    regions.sort(key=lambda r: (r[2] - r[0]) * (r[3] - r[1]), reverse=True)
+    return regions[:MAX_TABLE_REGIONS]
+
+def clean_cell(cell):
+    """清理单元格文本，使其可以放入 markdown 表格的一行中"""
+    if cell is None:
+        return ""
+    return re.sub(r'\s*\n\s*', ' ', str(cell)).replace('|', '\\|').strip()
+
+def table_to_markdown(rows, output_format='markdown'):
+    """将表格行转换为 GitHub 风格的 markdown 表格，纯文本模式下用制表符分隔"""
+    rows = [[clean_cell(cell) for cell in row] for row in rows]
+    if output_format == 'text':
+        return '\n'.join('\t'.join(row) for row in rows)
+
+    width = max(len(row) for row in rows)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    lines = ['| ' + ' | '.join(rows[0]) + ' |', '|' + ' --- |' * width]
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+    return '\n'.join(lines)
+
+def extract_tables(page):
+    """只在候选区域内运行 pdfplumber 的表格识别，返回 [(bbox, rows), ...]"""
+    tables = []
+    for x0, top, x1, bottom in find_table_regions(page):
+        bbox = (
+            max(x0 - RULING_JOIN_TOLERANCE, page.bbox[0]),
+            max(top - RULING_JOIN_TOLERANCE, page.bbox[1]),
+            min(x1 + RULING_JOIN_TOLERANCE, page.bbox[2]),
+            min(bottom + RULING_JOIN_TOLERANCE, page.bbox[3]),
+        )
+        for table in page.crop(bbox).find_tables(TABLE_SETTINGS):
+            rows = table.extract()
+            # 单行或单列的框线通常是文本框，不当作表格
+            if len(rows) < 2 or max(len(row) for row in rows) < 2:
+                continue
+            # 所有单元格都为空的通常是图形或标记重叠出来的格子
+            if not any(clean_cell(cell) for row in rows for cell in row):
+                continue
+            tables.append((table.bbox, rows))
+    return tables
+
+def process_page(page, output_format='text'):
+    """处理单个页面：表格输出为 markdown 表格，其余文本按原方式处理，按阅读顺序排列"""
+    tables = extract_tables(page)
+    if not tables:
+        return process_text_with_formatting(page, output_format)
+
+    tables.sort(key=lambda item: (item[0][1], item[0][0]))
+    bboxes = [bbox for bbox, _ in tables]
+
+    def in_table(obj):
+        x = (obj['x0'] + obj['x1']) / 2
+        y = (obj['top'] + obj['bottom']) / 2
+        return any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+
+    def band_text(band_top, band_bottom):
+        # 表格中的字符不进入普通文本流
+        band = page.filter(lambda obj: obj.get('object_type') != 'char' or (
+            band_top <= (obj['top'] + obj['bottom']) / 2 < band_bottom and not in_table(obj)
+        ))
+        return process_text_with_formatting(band, output_format)
+
+    blocks = []
+    cursor = float('-inf')
+    for bbox, rows in tables:
+        blocks.append(band_text(cursor, bbox[1]))
+        blocks.append(table_to_markdown(rows, output_format))
+        cursor = bbox[1]
+    blocks.append(band_text(cursor, float('inf')))
+
+    return '\n\n'.join(block for block in blocks if block)
+
+# 页眉页脚检测参数
+# 页面顶部和底部各占页面高度的比例，只在这两个区域内查找重复内容
+FURNITURE_BAND_RATIO = 0.08
+# 预扫描最多抽样的页数
+FURNITURE_SAMPLE_PAGES = 20
+# 文档至少需要的页数，页数太少时无法判断是否重复
+FURNITURE_MIN_PAGES = 3
+# 在抽样页面中出现的比例达到该值即视为页眉页脚（允许奇偶页使用不同的页眉）
+FURNITURE_MIN_RATIO = 0.4
+
+def normalize_furniture_line(text):
+    """规范化页眉页脚行：数字替换为 #，以容忍页码等变化的数字"""
+    text = re.sub(r'\d+', '#', text)
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+def get_band_lines(page):
+    """返回页面顶部和底部区域中的文本行 [(位置, 规范化文本, top, bottom), ...]"""
+    x0, page_top, x1, page_bottom = page.bbox
+    band = (page_bottom - page_top) * FURNITURE_BAND_RATIO
+    lines = []
+    for position, bbox in (
+        ('top', (x0, page_top, x1, page_top + band)),
+        ('bottom', (x0, page_bottom - band, x1, page_bottom)),
+    ):
+        for line in page.within_bbox(bbox).extract_text_lines():
+            key = normalize_furniture_line(line['text'])
+            if key:
+                lines.append((position, key, line['top'], line['bottom']))
+    return lines
+
+def build_furniture_index(pages, sample_size=FURNITURE_SAMPLE_PAGES, cancel_token=None):
+    """抽样预扫描页面的顶部和底部区域，返回重复出现的页眉页脚集合 {(位置, 规范化文本)}
+
+    每个抽样页之前检查 cancel_token，到期或被取消时返回空集合。
+    """
+    if len(pages) < FURNITURE_MIN_PAGES:
+        return set()
+
+    # 在整个文档中均匀抽样，避免只看到前几页的章节页眉
+    step = max(1, len(pages) / sample_size)
+    sample = [pages[int(i * step)] for i in range(min(sample_size, len(pages)))]
+
+    counts = {}
+    for page in sample:
+        if cancel_token and cancel_token.stopped:
+            return set()
+        # 每页同一行只计一次
+        for position, key, _, _ in set(get_band_lines(page)):
+            counts[(position, key)] = counts.get((position, key), 0) + 1
+
+    threshold = max(2, len(sample) * FURNITURE_MIN_RATIO)
+    return {item for item, count in counts.items() if count >= threshold}
+
+def strip_furniture(page, furniture):
+    """从页面中移除属于页眉页脚的文本行，返回过滤后的页面"""
+    if not furniture:
+        return page
+
+    ranges = [
+        (top, bottom) for position, key, top, bottom in get_band_lines(page)
+        if (position, key) in furniture
+    ]
+    if not ranges:
+        return page
+
+    def keep(obj):
+        if obj.get('object_type') != 'char':
+            return True
+        y = (obj['top'] + obj['bottom']) / 2
+        return not any(top <= y <= bottom for top, bottom in ranges)
+
+    return page.filter(keep)
+
+def convert_pdf(pdf_path, output_format='text', remove_furniture=True,
+                deadline_seconds=None, max_pages=None, cancel_token=None,
+                page_range=None, furniture=None):
+    """将 PDF 转换为文本或 markdown，返回 {'text': ..., 'truncation': ..., 'error': ...}
+
+    转换出错时 error 为错误信息，否则为 None；没有提取到文本时 text 为 None。
+    deadline_seconds、max_pages 和 cancel_token 在页面之间检查。到期或被取消时
+    返回已经转换的部分文本，truncation 记录截断原因和已处理的页数；未截断时为 None。
+    page_range 为 (start, end) 时只转换这些页（从 0 开始，不含 end）；
+    furniture 可传入预先计算的页眉页脚集合，分片转换时避免每个分片各自预扫描。
+    """
+    result = {'text': None, 'truncation': None, 'error': None}
+    if cancel_token is None:
+        cancel_token = CancellationToken(deadline_seconds)
+    elif deadline_seconds and cancel_token.deadline is None:
+        cancel_token.deadline = cancel_token.started_at + deadline_seconds
+
     try:
         # 检查文件是否存在
         if not os.path.exists(pdf_path):
             print(f"错误：文件 {pdf_path} 不存在", file=sys.stderr)
-            return None
+            result['error'] = f"文件 {pdf_path} 不存在"
+            return result
 
         # 检查文件大小
         file_size = os.path.getsize(pdf_path)
         
         if file_size == 0:
             print(f"错误：文件 {pdf_path} 为空", file=sys.stderr)
-            return None
+            result['error'] = f"文件 {pdf_path} 为空"
+            return result
         
         # 打开PDF文件
         with pdfplumber.open(pdf_path) as pdf:
             # 存储所有页面的文本
             all_text = []
+            pages = pdf.pages[slice(*page_range)] if page_range else pdf.pages
+            total_pages = len(pages)
+            
+            # 抽样预扫描，找出重复的页眉页脚；在截断前的全部页面上抽样，
+            # 只转换前几页时也能识别页眉页脚
+            if not remove_furniture:
+                furniture = set()
+            elif furniture is None:
+                furniture = build_furniture_index(pages, cancel_token=cancel_token)
+            
+            if max_pages:
+                pages = pages[:max_pages]
             
             # 遍历所有页面
-            for page in pdf.pages:
-                # 提取带格式的文本
-                text = process_text_with_formatting(page, output_format)
+            pages_processed = 0
+            for page in pages:
+                # 每页开始前检查是否超时或被取消
+                reason = cancel_token.stop_reason()
+                if reason:
+                    break
+
+                # 提取带格式的文本，有线表格转换为 markdown 表格
+                text = process_page(strip_furniture(page, furniture), output_format)
+                pages_processed += 1
                 
                 if text:
                     # 确保文本是utf-8编码
                     if not isinstance(text, str):
                         text = text.decode('utf-8', errors='ignore')
                     all_text.append(text)
+            else:
+                reason = 'max_pages' if len(pages) < total_pages else None
+
+            if reason:
+                result['truncation'] = {
+                    'reason': reason,
+                    'pages_processed': pages_processed,
+                    'total_pages': total_pages,
+                }
+                print(f"警告：转换被截断（{reason}），已处理 {pages_processed}/{total_pages} 页", file=sys.stderr)
             
             # 合并所有页面的文本
             if all_text:
                 final_text = "\n\n".join(all_text)
                 # 清理多余的空行
                 final_text = re.sub(r'\n\s*\n\s*\n', '\n\n', final_text)
-                return final_text.strip()
+                result['text'] = final_text.strip()
             else:
                 print("警告：没有提取到任何文本", file=sys.stderr)
-                return None
+            return result
 
     except Exception as e:
         print(f"转换过程中出错: {str(e)}", file=sys.stderr)
         import traceback
         print(f"错误详情: {traceback.format_exc()}", file=sys.stderr)
-        return None
+        result['text'] = None
+        result['error'] = str(e) or type(e).__name__
+        return result
+
+def convert_pdf_to_text(pdf_path, output_format='text', remove_furniture=True, **limits):
+    """将 PDF 转换为文本或 markdown，remove_furniture 为 True 时移除重复的页眉页脚和页码
+
+    limits 可包含 deadline_seconds、max_pages 和 cancel_token，参见 convert_pdf。
+    """
+    return convert_pdf(pdf_path, output_format, remove_furniture, **limits)['text']
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+import pdfplumber
+
+# 以脚本方式运行时，把项目根目录加入 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from converters.pdf_converter import convert_pdf, build_furniture_index
+
+# 共享目录结构（每个任务一个子目录）：
+#   <spool>/<job_id>/job.json          任务描述：源文件、输出格式、分片列表、页眉页脚集合
+#   <spool>/<job_id>/pending/<id>.json 等待处理的分片
+#   <spool>/<job_id>/claimed/<id>.json 已被某个工作进程领取的分片，文件修改时间即租约心跳
+#   <spool>/<job_id>/claimed/<id>.json.<随机>.failing  转换出错、正在记录失败的分片（仅领取者可见）
+#   <spool>/<job_id>/done/<id>.md      分片转换结果
+#   <spool>/<job_id>/failed/<id>.json  重试 MAX_SHARD_ATTEMPTS 次后仍然失败的分片及错误信息
+#   <spool>/<job_id>/complete          协调进程合并结果后写入的标记，工作进程跳过已完成的任务
+#
+# 工作进程通过把分片从 pending 原子重命名到 claimed 来领取分片，同一分片只有一个进程能成功。
+# 租约过期（工作进程崩溃或失联）的分片会被重命名回 pending，由其他工作进程重新领取。
+# 源文件路径必须在所有主机上都能访问，例如位于同一个 NFS 挂载点下。
+
+# 每个分片包含的页数
+DEFAULT_SHARD_PAGES = 50
+# 租约有效期（秒），工作进程每隔三分之一租约刷新一次心跳
+DEFAULT_LEASE_SECONDS = 300
+# 轮询共享目录的间隔（秒）
+DEFAULT_POLL_INTERVAL = 1.0
+# 分片转换出错时最多尝试的次数，超过后记入 failed 目录
+MAX_SHARD_ATTEMPTS = 3
+# 任务完成标记文件名
+COMPLETE_MARKER = "complete"
+
+
+class ShardFailedError(RuntimeError):
+    """任务中有分片多次转换失败，合并结果会缺页"""
+
+    def __init__(self, job_id, failures):
+        self.job_id = job_id
+        self.failures = failures
+        details = "; ".join(f"{shard_id}: {error}" for shard_id, error in sorted(failures.items()))
+        super().__init__(f"任务 {job_id} 有 {len(failures)} 个分片转换失败: {details}")
+
+
+def _write_json_atomic(path, data):
+    """先写入临时文件再重命名，其他主机不会读到写了一半的文件"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def submit_job(spool_dir, sources, output_format='markdown', shard_pages=DEFAULT_SHARD_PAGES,
+               remove_furniture=True, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """把 PDF 文件按页码范围拆分成分片写入共享目录，返回任务 ID
+
+    页眉页脚集合在这里通过抽样预扫描计算一次，写入 job.json 供所有分片使用。
+    租约有效期同样记录在 job.json 中，所有工作进程和协调进程使用同一个值。
+    """
+    job_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    job_dir = os.path.join(spool_dir, job_id)
+    for name in ("pending", "claimed", "done", "failed"):
+        os.makedirs(os.path.join(job_dir, name), exist_ok=True)
+
+    shards = []
+    job_sources = []
+    for file_index, source in enumerate(sources):
+        source = os.path.abspath(source)
+        with pdfplumber.open(source) as pdf:
+            page_count = len(pdf.pages)
+            furniture = build_furniture_index(pdf.pages) if remove_furniture else set()
+        job_sources.append({
+            "path": source,
+            "pages": page_count,
+            "furniture": sorted(furniture),
+        })
+        for start in range(0, max(page_count, 1), shard_pages):
+            shards.append({
+                # 分片 ID 按文件序号和起始页补零，排序后即为合并顺序
+                "shard_id": f"{file_index:04d}-{start:06d}",
+                "file_index": file_index,
+                "start": start,
+                "end": min(start + shard_pages, page_count),
+            })
+
+    # 先写任务描述，再发布分片，工作进程领取分片时 job.json 一定已经存在
+    _write_json_atomic(os.path.join(job_dir, "job.json"), {
+        "job_id": job_id,
+        "output_format": output_format,
+        "remove_furniture": remove_furniture,
+        "lease_seconds": lease_seconds,
+        "sources": job_sources,
+        "shards": [shard["shard_id"] for shard in shards],
+    })
+    for shard in shards:
+        _write_json_atomic(os.path.join(job_dir, "pending", f"{shard['shard_id']}.json"), shard)
+    return job_id
+
+
+def _job_lease(job, default=DEFAULT_LEASE_SECONDS):
+    """任务的租约有效期，没有记录租约的旧任务使用 default"""
+    return job.get("lease_seconds") or default
+
+
+def requeue_expired(job_dir, lease_seconds=None):
+    """把租约过期的分片放回 pending，已有结果的分片直接清除领取记录，返回重新排队的数量
+
+    lease_seconds 为 None 时使用 job.json 中记录的租约有效期。
+    租约根据 claimed 文件的修改时间判断，各主机的时钟需要大致同步。
+    """
+    if lease_seconds is None:
+        lease_seconds = _job_lease(_read_json(os.path.join(job_dir, "job.json")))
+    claimed_dir = os.path.join(job_dir, "claimed")
+    requeued = 0
+    now = time.time()
+    for name in os.listdir(claimed_dir):
+        claimed_path = os.path.join(claimed_dir, name)
+        shard_name = name.split(".")[0] + ".json"
+        try:
+            if name.endswith(".failing"):
+                # 工作进程在记录失败的过程中退出：已经写入 pending 或 failed 时直接清除，否则放回 pending
+                if os.path.getmtime(claimed_path) + lease_seconds >= now:
+                    continue
+                if any(os.path.exists(os.path.join(job_dir, d, shard_name)) for d in ("pending", "failed")):
+                    os.remove(claimed_path)
+                else:
+                    os.rename(claimed_path, os.path.join(job_dir, "pending", shard_name))
+                    requeued += 1
+                continue
+            if not name.endswith(".json"):
+                continue
+            if os.path.exists(os.path.join(job_dir, "done", name[:-5] + ".md")):
+                os.remove(claimed_path)
+                continue
+            if os.path.getmtime(claimed_path) + lease_seconds >= now:
+                continue
+            os.rename(claimed_path, os.path.join(job_dir, "pending", name))
+            requeued += 1
+        except FileNotFoundError:
+            # 其他进程已经处理了这个分片
+            continue
+    return requeued
+
+
+def claim_shard(job_dir):
+    """尝试领取一个分片，成功时返回 (分片, claimed 文件路径)，没有可领取的分片时返回 None"""
+    pending_dir = os.path.join(job_dir, "pending")
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith(".json"):
+            continue
+        pending_path = os.path.join(pending_dir, name)
+        claimed_path = os.path.join(job_dir, "claimed", name)
+        try:
+            # 重命名不会更新修改时间，先刷新租约起点再重命名，
+            # 否则分片在 pending 中等待过久时，刚领取就会被判定为租约过期
+            os.utime(pending_path)
+            os.rename(pending_path, claimed_path)
+        except FileNotFoundError:
+            # 被其他工作进程抢先领取
+            continue
+        return _read_json(claimed_path), claimed_path
+    return None
+
+
+def _heartbeat(claimed_path, lease_seconds, stop_event):
+    """定期刷新 claimed 文件的修改时间以续租"""
+    while not stop_event.wait(lease_seconds / 3):
+        try:
+            os.utime(claimed_path)
+        except FileNotFoundError:
+            return
+
+
+def process_shard(job_dir, job, shard, claimed_path, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """转换一个分片并写入 done 目录
+
+    转换出错时不写入结果：尝试次数未达到 MAX_SHARD_ATTEMPTS 时放回 pending 重试，
+    否则把错误信息写入 failed 目录。
+    """
+    source = job["sources"][shard["file_index"]]
+    stop_event = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(claimed_path, lease_seconds, stop_event), daemon=True)
+    heartbeat.start()
+    try:
+        result = convert_pdf(
+            source["path"],
+            job["output_format"],
+            remove_furniture=job["remove_furniture"],
+            page_range=(shard["start"], shard["end"]),
+            furniture={tuple(item) for item in source["furniture"]},
+        )
+    finally:
+        stop_event.set()
+        heartbeat.join()
+
+    if result["error"]:
+        # 先把 claimed 文件重命名为私有名称，确认分片仍归本进程所有后再改写；
+        # 重命名失败说明租约已过期、分片已被重新排队，此时什么也不做
+        failing_path = f"{claimed_path}.{uuid.uuid4().hex}.failing"
+        try:
+            os.rename(claimed_path, failing_path)
+        except FileNotFoundError:
+            return False
+        shard = dict(shard, attempts=shard.get("attempts", 0) + 1, error=result["error"])
+        if shard["attempts"] < MAX_SHARD_ATTEMPTS:
+            _write_json_atomic(os.path.join(job_dir, "pending", f"{shard['shard_id']}.json"), shard)
+        else:
+            _write_json_atomic(os.path.join(job_dir, "failed", f"{shard['shard_id']}.json"), shard)
+        os.remove(failing_path)
+        return False
+
+    done_path = os.path.join(job_dir, "done", f"{shard['shard_id']}.md")
+    tmp_path = f"{done_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(result["text"] or "")
+    os.replace(tmp_path, done_path)
+    try:
+        os.remove(claimed_path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def run_worker(spool_dir, lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL,
+               exit_when_idle=False):
+    """工作进程主循环：在所有任务中领取并转换分片，返回处理的分片数
+
+    租约有效期使用各任务 job.json 中记录的值，lease_seconds 只用于没有记录租约的旧任务。
+    exit_when_idle 为 True 时，没有可领取的分片就退出，否则持续轮询。
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+    while True:
+        claimed = None
+        for job_id in sorted(os.listdir(spool_dir)):
+            job_dir = os.path.join(spool_dir, job_id)
+            job_path = os.path.join(job_dir, "job.json")
+            if os.path.exists(os.path.join(job_dir, COMPLETE_MARKER)) or not os.path.exists(job_path):
+                continue
+            job = _read_json(job_path)
+            lease = _job_lease(job, lease_seconds)
+            requeue_expired(job_dir, lease)
+            claimed = claim_shard(job_dir)
+            if claimed:
+                break
+
+        if not claimed:
+            if exit_when_idle:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        shard, claimed_path = claimed
+        print(f"{worker_id}: 正在处理 {job_id}/{shard['shard_id']}", file=sys.stderr, flush=True)
+        process_shard(job_dir, job, shard, claimed_path, lease)
+        processed += 1
+
+
+def _mark_complete(job_dir):
+    """写入任务完成标记，工作进程轮询时不再扫描该任务"""
+    with open(os.path.join(job_dir, COMPLETE_MARKER), "w", encoding="utf-8") as f:
+        f.write(time.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def collect_results(spool_dir, job_id, poll_interval=DEFAULT_POLL_INTERVAL, timeout=None):
+    """等待任务的所有分片完成，按顺序合并，返回 {源文件路径: 文本}
+
+    等待期间按 job.json 中记录的租约有效期把租约过期的分片重新排队。有分片多次转换失败时抛出 ShardFailedError，
+    超过 timeout 秒仍未完成时抛出 TimeoutError。
+    """
+    job_dir = os.path.join(spool_dir, job_id)
+    job = _read_json(os.path.join(job_dir, "job.json"))
+    done_dir = os.path.join(job_dir, "done")
+    failed_dir = os.path.join(job_dir, "failed")
+    started_at = time.monotonic()
+
+    while True:
+        done = {name[:-3] for name in os.listdir(done_dir) if name.endswith(".md")}
+        missing = [shard_id for shard_id in job["shards"] if shard_id not in done]
+        if not missing:
+            break
+        failures = {}
+        for shard_id in missing:
+            failed_path = os.path.join(failed_dir, f"{shard_id}.json")
+            if os.path.exists(failed_path):
+                failures[shard_id] = _read_json(failed_path).get("error")
+        if failures:
+            _mark_complete(job_dir)
+            raise ShardFailedError(job_id, failures)
+        if timeout is not None and time.monotonic() - started_at > timeout:
+            raise TimeoutError(f"任务 {job_id} 仍有 {len(missing)} 个分片未完成")
+        requeue_expired(job_dir, _job_lease(job))
+        time.sleep(poll_interval)
+
+    _mark_complete(job_dir)
+    parts = {}
+    for shard_id in job["shards"]:
+        with open(os.path.join(done_dir, f"{shard_id}.md"), encoding="utf-8") as f:
+            text = f.read()
+        if text:
+            parts.setdefault(int(shard_id.split("-")[0]), []).append(text)
+
+    return {
+        source["path"]: "\n\n".join(parts.get(file_index, []))
+        for file_index, source in enumerate(job["sources"])
+    }
+
+
+def write_results(results, output_dir, output_format='markdown'):
+    """把合并结果写入输出目录，每个源文件一个文件，返回写入的路径列表"""
+    os.makedirs(output_dir, exist_ok=True)
+    extension = 'md' if output_format == 'markdown' else 'txt'
+    paths = []
+    for source, text in results.items():
+        name = os.path.splitext(os.path.basename(source))[0]
+        path = os.path.join(output_dir, f"{name}.{extension}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded multi-worker PDF conversion via a shared spool directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="拆分任务、等待工作进程完成并合并结果")
+    run_parser.add_argument("spool_dir", help="共享目录")
+    run_parser.add_argument("sources", nargs="+", help="PDF 文件路径（所有工作进程都必须能访问）")
+    run_parser.add_argument("--output-dir", "-o", default=".", help="输出目录")
+    run_parser.add_argument("--format", choices=["markdown", "text"], default="markdown", help="输出格式")
+    run_parser.add_argument("--shard-pages", type=int, default=DEFAULT_SHARD_PAGES, help="每个分片的页数")
+    run_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                            help="租约有效期（秒），记录在任务中供所有工作进程使用")
+    run_parser.add_argument("--timeout", type=float, help="等待所有分片完成的最长时间（秒）")
+
+    worker_parser = subparsers.add_parser("worker", help="启动工作进程，领取并转换分片")
+    worker_parser.add_argument("spool_dir", help="共享目录")
+    worker_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                               help="没有记录租约的旧任务使用的租约有效期（秒）")
+    worker_parser.add_argument("--exit-when-idle", action="store_true", help="没有可领取的分片时退出")
+
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        count = run_worker(args.spool_dir, args.lease, exit_when_idle=args.exit_when_idle)
+        print(f"处理了 {count} 个分片", file=sys.stderr)
+    else:
+        job_id = submit_job(args.spool_dir, args.sources, args.format, args.shard_pages,
+                            lease_seconds=args.lease)
+        print(f"任务 {job_id} 已提交", file=sys.stderr, flush=True)
+        try:
+            results = collect_results(args.spool_dir, job_id, timeout=args.timeout)
+        except (TimeoutError, ShardFailedError) as e:
+            print(f"错误: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        for path in write_results(results, args.output_dir, args.format):
+            print(path)
@@ -1,6 +1,8 @@
 import os
 import sys
+import argparse
 import json
+import signal
 import subprocess
 import tempfile
 import time
@@ -8,6 +10,10 @@ from moviepy.editor import VideoFileClip
 import whisper
 from opencc import OpenCC
 
+# 以脚本方式运行时，把项目根目录加入 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from converters.cancellation import CancellationToken
+
 # 设置 ffmpeg 路径
 FFMPEG_PATH = r"C:\Users\Grant\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-7.1.1-full_build\bin\ffmpeg.exe"
 os.environ["IMAGEIO_FFMPEG_EXE"] = FFMPEG_PATH
@@ -17,34 +23,138 @@ os.environ["PATH"] = os.path.dirname(FFMPEG_PATH) + os.pathsep + os.environ["PAT
 sys.stdout.reconfigure(encoding='utf-8')
 sys.stderr.reconfigure(encoding='utf-8')
 
+# 每次送入 Whisper 的音频窗口长度（秒），与模型的 30 秒上下文窗口一致
+WINDOW_SECONDS = 30
+# 窗口末尾这段时间内结束的片段可能被截断，留到下一个窗口重新识别
+WINDOW_MARGIN_SECONDS = 2
+
+# Whisper 解码配置档：fast 使用更小的模型和贪心解码，accurate 使用更大的模型和 beam search
+# rtf 是在 4 核 CPU 上粗略估计的实时率（识别耗时 / 音频时长），供 auto 模式选择配置档
+DECODING_PROFILES = {
+    "fast": {"model": "tiny", "beam_size": None, "best_of": None, "rtf": 0.1},
+    "balanced": {"model": "base", "beam_size": 5, "best_of": 5, "rtf": 0.4},
+    "accurate": {"model": "small", "beam_size": 5, "best_of": 5, "rtf": 1.2},
+}
+# rtf 估计值对应的参考 CPU 核数
+REFERENCE_CORES = 4
+# 未指定截止时间时，auto 模式默认的目标实时率
+DEFAULT_TARGET_RTF = 0.5
+# 短音频至少允许的识别耗时（秒），保证短片段也能使用更准确的配置档
+MIN_BUDGET_SECONDS = 60
+
+
+def send_event(event_type, **fields):
+    """向 Node.js 进程发送一条 NDJSON 事件（每行一个 JSON 对象）"""
+    event = {"type": event_type}
+    event.update(fields)
+    print(json.dumps(event, ensure_ascii=False), flush=True)
+
 def send_progress(progress, message):
-    """Send progress update to Node.js process and print to console"""
-    output = f"进度 {progress}%: {message}"
-    print(output, flush=True)  # 输出到控制台
-    print(json.dumps({
-        "type": "complete",
-        "content": output
-    }, ensure_ascii=False), flush=True)
+    """Send progress update to Node.js process"""
+    send_event("progress", progress=int(progress), message=message)
+
+def send_segment(index, start, end, text):
+    """Send a single recognized segment to Node.js process"""
+    send_event("segment", index=index, start=round(start, 2), end=round(end, 2),
+               timestamp=format_timestamp(start), text=text)
 
 def send_error(message):
-    """Send error message to Node.js process and print to console"""
-    output = f"错误: {message}"
-    print(output, flush=True)  # 输出到控制台
-    print(json.dumps({
-        "type": "complete",
-        "content": output
-    }, ensure_ascii=False), flush=True)
-
-def send_complete(content):
-    """Send completion message with content to Node.js process and print to console"""
-    print(content, flush=True)  # 输出到控制台
-    print(json.dumps({
-        "type": "complete",
-        "content": content
-    }, ensure_ascii=False), flush=True)
-
-def convert_video_to_markdown(video_path):
-    """Convert video to markdown using Whisper"""
+    """Send error message to Node.js process"""
+    send_event("error", error=message)
+
+def send_result(content, **metadata):
+    """Send the final markdown to Node.js process"""
+    send_event("result", content=content, **metadata)
+
+def format_timestamp(seconds):
+    """将秒数格式化为 MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+def estimate_rtf(profile_name, cores=None):
+    """根据可用 CPU 核数估计配置档的实时率"""
+    cores = cores or os.cpu_count() or 1
+    return DECODING_PROFILES[profile_name]["rtf"] * REFERENCE_CORES / min(cores, REFERENCE_CORES * 4)
+
+def select_profile(duration, cores=None, target_rtf=None, deadline_seconds=None):
+    """为 auto 模式选择配置档：在预计耗时满足目标的前提下选择最准确的配置档
+
+    deadline_seconds 优先于 target_rtf；两者都未指定时使用 DEFAULT_TARGET_RTF，
+    并且至少允许 MIN_BUDGET_SECONDS 秒。
+    短音频通常能使用 accurate，长音频会逐级降到 balanced 或 fast。
+    """
+    if deadline_seconds is not None:
+        budget = deadline_seconds
+    else:
+        budget = max(duration * (target_rtf or DEFAULT_TARGET_RTF), MIN_BUDGET_SECONDS)
+
+    for name in ("accurate", "balanced"):
+        if duration * estimate_rtf(name, cores) <= budget:
+            return name
+    return "fast"
+
+def transcribe_segments(model, audio, on_window=None, cancel_token=None, **decode_options):
+    """按窗口逐段识别音频，每个窗口识别完成后立即产出其中的片段
+
+    audio 是 whisper.load_audio 返回的 16kHz 采样数组。每个窗口结束处
+    可能被截断的片段不会产出，而是从它的起点开始重新识别下一个窗口。
+    每个窗口开始前检查 cancel_token，到期或被取消时停止产出。
+    """
+    sample_rate = whisper.audio.SAMPLE_RATE
+    total_samples = len(audio)
+    window_samples = WINDOW_SECONDS * sample_rate
+    position = 0
+    previous_text = ""
+
+    while position < total_samples:
+        if cancel_token and cancel_token.stopped:
+            return
+
+        window_end = min(position + window_samples, total_samples)
+        is_last = window_end >= total_samples
+        offset = position / sample_rate
+
+        result = model.transcribe(
+            audio[position:window_end],
+            initial_prompt=previous_text or None,
+            **decode_options
+        )
+        segments = result.get("segments", []) if result else []
+
+        # 非最后一个窗口时，丢弃贴近窗口末尾的片段，下一窗口从该处继续
+        cutoff = (window_end - position) / sample_rate - WINDOW_MARGIN_SECONDS
+        emitted = segments if is_last else [s for s in segments if s["end"] <= cutoff]
+        if not emitted and segments and not is_last:
+            emitted = segments[:1]
+
+        for segment in emitted:
+            yield offset + segment["start"], offset + segment["end"], segment["text"]
+
+        if emitted and not is_last:
+            next_position = position + int(emitted[-1]["end"] * sample_rate)
+            # 保证至少前进一秒，避免在同一位置反复识别
+            position = max(next_position, position + sample_rate)
+            previous_text = emitted[-1]["text"]
+        else:
+            position = window_end
+
+        if on_window:
+            on_window(min(position, total_samples) / total_samples)
+
+def convert_video_to_markdown(video_path, profile="auto", target_rtf=None, deadline_seconds=None,
+                              max_audio_seconds=None, cancel_token=None):
+    """Convert video to markdown using Whisper
+
+    profile 可选 fast / balanced / accurate，或 auto 按音频时长、CPU 核数和
+    target_rtf / 剩余时间自动选择。deadline_seconds 是整个转换的时间上限，
+    max_audio_seconds 只识别音频的前若干秒；到期或通过 cancel_token 取消时，
+    发送已识别部分的结果，并在 truncation 中记录截断原因。
+    """
+    if cancel_token is None:
+        cancel_token = CancellationToken(deadline_seconds)
+    elif deadline_seconds and cancel_token.deadline is None:
+        cancel_token.deadline = cancel_token.started_at + deadline_seconds
+
     model = None
     video = None
     temp_audio_path = None
@@ -60,213 +170,142 @@ def convert_video_to_markdown(video_path):
             send_error(f"视频文件不可读: {video_path}")
             return
 
-        # 发送进度更新
-        send_progress(10, "正在加载Whisper模型...")
-        
-        # 加载Whisper模型
-        try:
-            model = whisper.load_model("base")
-            send_progress(20, "Whisper模型加载成功")
-        except Exception as e:
-            send_error(f"加载Whisper模型失败: {str(e)}")
+        if profile != "auto" and profile not in DECODING_PROFILES:
+            send_error(f"未知的解码配置档: {profile}")
             return
 
         # 创建临时音频文件
         temp_audio = f"temp_audio_{os.getpid()}_{int(time.time())}.mp3"
         temp_audio_path = os.path.join(os.path.dirname(video_path), temp_audio)
         
-        send_progress(30, "正在从视频中提取音频...")
+        send_progress(0, "正在从视频中提取音频...")
         
         # 提取音频
         try:
             video = VideoFileClip(video_path)
-            video.audio.write_audiofile(temp_audio_path)
+            video.audio.write_audiofile(temp_audio_path, logger=None)
             video.close()
             video = None  # 确保视频对象被释放
-            send_progress(40, "音频提取完成")
         except Exception as e:
             send_error(f"提取音频失败: {str(e)}")
             return
 
         # 检查音频文件是否成功创建
-        if not os.path.exists(temp_audio_path):
+        if not os.path.exists(temp_audio_path) or os.path.getsize(temp_audio_path) == 0:
             send_error("音频文件创建失败")
             return
 
-        # 检查音频文件是否可读
-        if not os.access(temp_audio_path, os.R_OK):
-            send_error("音频文件不可读")
+        try:
+            audio = whisper.load_audio(temp_audio_path)
+        except Exception as e:
+            send_error(f"读取音频失败: {str(e)}")
             return
 
-        # 检查音频文件大小
-        if os.path.getsize(temp_audio_path) == 0:
+        duration = len(audio) / whisper.audio.SAMPLE_RATE
+        if duration == 0:
             send_error("音频文件为空")
             return
 
-        send_progress(50, "正在进行语音识别...")
-        
-        # 使用Whisper进行语音识别
+        # 只识别音频的前 max_audio_seconds 秒
+        truncation_reason = None
+        if max_audio_seconds and duration > max_audio_seconds:
+            audio = audio[:int(max_audio_seconds * whisper.audio.SAMPLE_RATE)]
+            truncation_reason = "max_audio_seconds"
+        audio_seconds = len(audio) / whisper.audio.SAMPLE_RATE
+
+        # 根据音频时长和剩余时间选择解码配置档，然后加载对应的Whisper模型
+        if profile == "auto":
+            profile = select_profile(audio_seconds, target_rtf=target_rtf, deadline_seconds=cancel_token.remaining())
+        settings = DECODING_PROFILES[profile]
+
+        # 截止时间已过或已被取消时不再加载模型，直接返回空的截断结果
+        reason = cancel_token.stop_reason()
+        if reason:
+            send_result(
+                "# 视频转文字\n\n",
+                segments=0,
+                duration=round(duration, 2),
+                profile=profile,
+                model=settings["model"],
+                rtf=None,
+                truncation={"reason": reason, "audio_seconds_processed": 0.0, "duration": round(duration, 2)}
+            )
+            return
+
+        send_progress(0, f"正在加载Whisper模型 {settings['model']}（{profile}）...")
+        try:
+            model = whisper.load_model(settings["model"])
+        except Exception as e:
+            send_error(f"加载Whisper模型失败: {str(e)}")
+            return
+
+        send_progress(0, f"正在进行语音识别，音频时长 {format_timestamp(audio_seconds)}")
+
+        processed_seconds = 0.0
+
+        def on_window(fraction):
+            nonlocal processed_seconds
+            processed_seconds = fraction * audio_seconds
+            send_progress(fraction * 100, f"已识别 {format_timestamp(processed_seconds)} / {format_timestamp(audio_seconds)}")
+
+        # 逐段识别，每个片段繁简转换后立即发送
+        cc = OpenCC('t2s')
+        processed_segments = []
+        started_at = time.monotonic()
         try:
-            # 使用绝对路径而不是切换目录
-            output = f"开始语音识别，音频文件路径: {temp_audio_path}"
-            print(output, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": output
-            }, ensure_ascii=False), flush=True)
-            
-            # 检查音频文件大小
-            audio_size = os.path.getsize(temp_audio_path)
-            output = f"音频文件大小: {audio_size / 1024 / 1024:.2f} MB"
-            print(output, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": output
-            }, ensure_ascii=False), flush=True)
-            
-            # 设置 Whisper 的转录参数
-            result = model.transcribe(
-                temp_audio_path,
+            for start, end, text in transcribe_segments(
+                model,
+                audio,
+                on_window=on_window,
+                cancel_token=cancel_token,
                 language="zh",  # 指定语言为中文
                 task="transcribe",  # 指定任务为转录
                 fp16=False,  # 使用 FP32 以提高稳定性
-                beam_size=5,  # 增加 beam size 以提高准确性
-                best_of=5,  # 增加候选数量
+                beam_size=settings["beam_size"],  # beam size 为 None 时使用贪心解码
+                best_of=settings["best_of"],
                 temperature=0.0,  # 使用确定性采样
                 condition_on_previous_text=True,  # 考虑上下文
                 no_speech_threshold=0.6,  # 调整无语音阈值
                 logprob_threshold=-1.0,  # 调整日志概率阈值
                 compression_ratio_threshold=1.2  # 调整压缩比阈值
-            )
-            
-            # 检查转录结果
-            if not result or 'segments' not in result:
-                output = "警告：转录结果为空或格式不正确"
-                print(output, flush=True)  # 输出到控制台
-                print(json.dumps({
-                    "type": "complete",
-                    "content": output
-                }, ensure_ascii=False), flush=True)
-                send_error("语音识别结果为空")
-                return
-                
-            # 检查片段数量
-            segments_count = len(result['segments'])
-            output = f"语音识别完成，识别到 {segments_count} 个片段"
-            print(output, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": output
-            }, ensure_ascii=False), flush=True)
-            
-            # 检查每个片段的内容
-            valid_segments = 0
-            total_text_length = 0
-            for i, segment in enumerate(result['segments']):
-                if segment.get('text', '').strip():
-                    valid_segments += 1
-                    total_text_length += len(segment['text'])
-                    if i < 3:  # 只显示前3个片段
-                        output = f"片段 {i+1}: {segment['text'][:50]}..."
-                        print(output, flush=True)  # 输出到控制台
-                        print(json.dumps({
-                            "type": "complete",
-                            "content": output
-                        }, ensure_ascii=False), flush=True)
-            
-            # 打印统计信息
-            output = f"有效片段数: {valid_segments}/{segments_count}, 总文本长度: {total_text_length} 字符"
-            print(output, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": output
-            }, ensure_ascii=False), flush=True)
-            
-            if valid_segments == 0:
-                output = "警告：没有识别到任何有效文本"
-                print(output, flush=True)  # 输出到控制台
-                print(json.dumps({
-                    "type": "complete",
-                    "content": output
-                }, ensure_ascii=False), flush=True)
-                send_error("语音识别结果为空")
-                return
-            
-            send_progress(80, "语音识别完成")
+            ):
+                text = text.strip()
+                if not text:
+                    continue
+                simplified_text = cc.convert(text)
+                send_segment(len(processed_segments), start, end, simplified_text)
+                processed_segments.append(f"**{format_timestamp(start)}** {simplified_text}")
         except Exception as e:
-            output = f"语音识别过程出错: {str(e)}"
-            print(output, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": output
-            }, ensure_ascii=False), flush=True)
             send_error(f"语音识别失败: {str(e)}")
             return
 
-        # 将繁体中文转换为简体中文
-        try:
-            send_progress(85, "正在进行繁简转换...")
-            cc = OpenCC('t2s')
-            
-            # 处理每个片段，保留时间戳
-            processed_segments = []
-            for segment in result["segments"]:
-                start_time = int(segment["start"])
-                minutes = start_time // 60
-                seconds = start_time % 60
-                timestamp = f"{minutes:02d}:{seconds:02d}"
-                
-                # 只转换文本内容，保留时间戳
-                text = segment["text"].strip()
-                if text:
-                    simplified_text = cc.convert(text)
-                    processed_segments.append(f"**{timestamp}** {simplified_text}")
-            
-            # 检查是否有处理后的文本
-            if not processed_segments:
-                send_error("语音识别结果为空")
-                return
-                
-            # 将所有片段组合成完整的markdown文本
-            markdown = "# 视频转文字\n\n" + "\n\n".join(processed_segments)
-            send_progress(90, "繁简转换完成")
-            
-            # 清空输出框并发送最终结果
-            print("", flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": ""  # 清空输出框
-            }, ensure_ascii=False), flush=True)
-            
-            # 发送最终结果
-            print(markdown, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": markdown
-            }, ensure_ascii=False), flush=True)
-            
-        except Exception as e:
-            send_error(f"繁简转换失败: {str(e)}")
-            return
+        # 识别在音频结束前停止时，说明已超时或被取消
+        if processed_seconds < audio_seconds:
+            truncation_reason = cancel_token.stop_reason() or "cancelled"
+        truncation = None
+        if truncation_reason:
+            truncation = {
+                "reason": truncation_reason,
+                "audio_seconds_processed": round(processed_seconds, 2),
+                "duration": round(duration, 2),
+            }
 
-        send_progress(90, "正在清理临时文件...")
-        
-        # 清理临时文件
-        try:
-            if os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
-            send_progress(100, "转换完成")
-        except Exception as e:
-            # 如果删除失败，记录错误但不影响结果
-            output = f"保留临时音频文件: {temp_audio_path}"
-            print(output, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": output
-            }, ensure_ascii=False), flush=True)
+        if not processed_segments and not truncation:
+            send_error("语音识别结果为空")
+            return
 
-        # 把生成的markdown发送给Node.js 
-        send_complete(markdown)
+        # 将所有片段组合成完整的markdown文本，只发送一次
+        markdown = "# 视频转文字\n\n" + "\n\n".join(processed_segments)
+        elapsed = time.monotonic() - started_at
+        send_result(
+            markdown,
+            segments=len(processed_segments),
+            duration=round(duration, 2),
+            profile=profile,
+            model=settings["model"],
+            rtf=round(elapsed / processed_seconds, 3) if processed_seconds else None,
+            truncation=truncation
+        )
 
     except Exception as e:
         send_error(f"转换失败: {str(e)}")
@@ -287,17 +326,22 @@ def convert_video_to_markdown(video_path):
             import gc
             gc.collect()
         except Exception as e:
-            output = f"清理资源时出错: {str(e)}"
-            print(output, flush=True)  # 输出到控制台
-            print(json.dumps({
-                "type": "complete",
-                "content": output
-            }, ensure_ascii=False), flush=True)
+            print(f"清理资源时出错: {str(e)}", file=sys.stderr, flush=True)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        send_error("请提供视频文件路径")
-        sys.exit(1)
-    
-    video_path = sys.argv[1]
-    convert_video_to_markdown(video_path) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convert video to markdown using Whisper")
+    parser.add_argument("video_path", help="视频文件路径")
+    parser.add_argument("--profile", choices=["auto"] + list(DECODING_PROFILES), default="auto",
+                        help="解码配置档（默认: auto）")
+    parser.add_argument("--target-rtf", type=float, help="auto 模式的目标实时率，例如 0.5")
+    parser.add_argument("--deadline", type=float, help="整个转换的时间上限（秒），到期返回已识别的部分")
+    parser.add_argument("--max-audio-seconds", type=float, help="只识别音频的前若干秒")
+    args = parser.parse_args()
+
+    # 收到终止信号时在当前窗口结束后停止，并发送已识别的部分结果
+    token = CancellationToken(args.deadline)
+    signal.signal(signal.SIGINT, lambda *_: token.cancel())
+    signal.signal(signal.SIGTERM, lambda *_: token.cancel())
+
+    convert_video_to_markdown(args.video_path, args.profile, args.target_rtf,
+                              max_audio_seconds=args.max_audio_seconds, cancel_token=token)
@@ -1,45 +1,373 @@
+import os
 import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, parse_qs
 import requests
-from youtube_transcript_api import YouTubeTranscriptApi
+from requests.adapters import HTTPAdapter
+from youtube_transcript_api import (
+    NoTranscriptFound,
+    TranscriptsDisabled,
+    VideoUnavailable,
+)
+# TranscriptListFetcher 是 youtube_transcript_api 0.6.x 的内部类（1.x 中已移除），
+# 用它才能传入共享的 Session；requirements.txt 和 pyproject.toml 都固定为 0.6.2
+try:
+    from youtube_transcript_api._transcripts import TranscriptListFetcher
+except ImportError as e:
+    raise ImportError(
+        "youtube_converter 需要 youtube-transcript-api 0.6.x（requirements.txt 固定为 0.6.2），"
+        "请执行 pip install youtube-transcript-api==0.6.2"
+    ) from e
 
-def get_video_title(video_id):
-    try:
-        response = requests.get(f'https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json')
-        video_info = response.json()
-        return video_info['title']
-    except:
-        return "YouTube Video"
+YOUTUBE_ORIGIN = "https://www.youtube.com"
+# oEmbed 接口地址，可通过环境变量指向本地的替身 HTTP 服务器进行离线测试
+OEMBED_URL = os.environ.get("YOUTUBE_OEMBED_URL", f"{YOUTUBE_ORIGIN}/oembed")
+# 字幕请求（watch 页面和 timedtext 接口）的站点地址，同样可以指向本地替身服务器
+TRANSCRIPT_BASE_URL = os.environ.get("YOUTUBE_TRANSCRIPT_BASE_URL", YOUTUBE_ORIGIN)
+# 请求超时（连接超时, 读取超时），单位秒
+REQUEST_TIMEOUT = (3.05, 10)
+# 标题和字幕的缓存有效期（秒）及最大条目数
+CACHE_TTL_SECONDS = 3600
+CACHE_MAX_ENTRIES = 1024
+DEFAULT_LANGUAGES = ('zh', 'en')
+DEFAULT_TITLE = "YouTube Video"
+# 这些错误重试也不会成功，批量转换时直接记为失败
+PERMANENT_ERRORS = (NoTranscriptFound, TranscriptsDisabled, VideoUnavailable)
+
+
+class TitleFetchError(Exception):
+    """oEmbed 获取视频标题失败"""
+
+
+class TTLCache:
+    """线程安全的简单 TTL 缓存，超过 max_entries 时淘汰最早写入的条目"""
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.max_entries:
+                # dict 保持插入顺序，第一个键就是最早写入的条目
+                del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class HostRateLimiter:
+    """按主机限速：同一主机的两次请求之间至少间隔 1 / rate 秒"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class TranscriptHttpClient:
+    """供 youtube_transcript_api 使用的 HTTP 客户端
+
+    复用共享的连接池，为每个请求加上超时，并把发往 youtube.com 的请求
+    改写到 TRANSCRIPT_BASE_URL。获取一份字幕需要请求 watch 页面和 timedtext 接口，
+    传入 limiter 时每个请求都按主机限速。youtube_transcript_api 只用到 get() 和 cookies。
+    """
 
-def convert_youtube_to_markdown(video_id):
+    def __init__(self, session, base_url=None, timeout=None, limiter=None):
+        self.session = session
+        self.base_url = (base_url or TRANSCRIPT_BASE_URL).rstrip("/")
+        self.timeout = timeout or REQUEST_TIMEOUT
+        self.limiter = limiter
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    def get(self, url, **kwargs):
+        if url.startswith(YOUTUBE_ORIGIN):
+            url = self.base_url + url[len(YOUTUBE_ORIGIN):]
+        if self.limiter:
+            self.limiter.wait(urlparse(url).netloc)
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+
+_title_cache = TTLCache()
+_transcript_cache = TTLCache()
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="youtube")
+
+
+def get_session():
+    """返回共享的带连接池的 requests.Session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def extract_video_id(url_or_id):
+    """从 YouTube URL 中提取视频 ID；传入的已经是 ID 时原样返回，无法识别时返回 None"""
+    value = url_or_id.strip()
+    if "://" not in value and "/" not in value:
+        return value or None
+
+    parsed = urlparse(value if "://" in value else f"https://{value}")
+    host = parsed.netloc.lower()
+    if host.endswith("youtu.be"):
+        video_id = parsed.path.lstrip("/").split("/")[0]
+    elif "youtube.com" in host:
+        if parsed.path.startswith(("/embed/", "/shorts/", "/live/")):
+            video_id = parsed.path.split("/")[2]
+        else:
+            video_id = parse_qs(parsed.query).get("v", [""])[0]
+    else:
+        return None
+    return video_id or None
+
+
+def get_video_title(video_id, limiter=None, strict=False):
+    """通过 oEmbed 获取视频标题，失败时返回默认标题；strict 为 True 时抛出 TitleFetchError"""
+    cached = _title_cache.get(video_id)
+    if cached is not None:
+        return cached
+
+    if limiter:
+        limiter.wait(urlparse(OEMBED_URL).netloc)
     try:
-        # 获取视频标题
-        title = get_video_title(video_id)
-        
-        # 获取视频字幕
-        transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=['zh', 'en'])
-        
-        # 构建Markdown内容
-        markdown = f"# {title}\n\n"
-        markdown += "## 视频字幕\n\n"
-        
-        for entry in transcript:
-            start_time = int(entry['start'])
-            minutes = start_time // 60
-            seconds = start_time % 60
-            timestamp = f"{minutes:02d}:{seconds:02d}"
-            markdown += f"**{timestamp}** {entry['text']}\n\n"
-        
-        return markdown
-        
+        response = get_session().get(
+            OEMBED_URL,
+            params={"url": f"https://www.youtube.com/watch?v={video_id}", "format": "json"},
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        title = response.json()['title']
     except Exception as e:
-        print(f"Error: {str(e)}", file=sys.stderr)
-        sys.exit(1)
+        # 获取失败时不缓存，下次请求重新尝试
+        if strict:
+            raise TitleFetchError(f"无法获取视频标题: {str(e) or type(e).__name__}") from e
+        return DEFAULT_TITLE
+
+    _title_cache.set(video_id, title)
+    return title
+
+
+def get_transcript(video_id, languages=DEFAULT_LANGUAGES, limiter=None):
+    """获取视频字幕，按视频 ID 和语言列表缓存"""
+    key = (video_id, tuple(languages))
+    cached = _transcript_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 不使用 YouTubeTranscriptApi.get_transcript()：它每次调用都新建 Session，且请求没有超时
+    client = TranscriptHttpClient(get_session(), limiter=limiter)
+    transcript = TranscriptListFetcher(client).fetch(video_id).find_transcript(list(languages)).fetch()
+    _transcript_cache.set(key, transcript)
+    return transcript
+
+
+def fetch_video(video_id, languages=DEFAULT_LANGUAGES, limiter=None, strict_title=False):
+    """并发获取视频标题和字幕，返回 (title, transcript)；字幕获取失败时抛出异常
+
+    strict_title 为 True 时，标题获取失败也抛出 TitleFetchError，而不是使用默认标题。
+    """
+    title_future = _executor.submit(get_video_title, video_id, limiter, strict_title)
+    transcript = get_transcript(video_id, languages, limiter)
+    return title_future.result(), transcript
+
+
+def build_markdown(title, transcript):
+    """根据标题和字幕条目构建Markdown内容"""
+    parts = [f"# {title}\n\n", "## 视频字幕\n\n"]
+    for entry in transcript:
+        start_time = int(entry['start'])
+        minutes = start_time // 60
+        seconds = start_time % 60
+        parts.append(f"**{minutes:02d}:{seconds:02d}** {entry['text']}\n\n")
+    return "".join(parts)
+
+
+def convert_youtube_to_markdown(video_id, languages=DEFAULT_LANGUAGES):
+    title, transcript = fetch_video(video_id, languages)
+    return build_markdown(title, transcript)
+
+
+def _fetch_with_retry(video_id, languages, limiter, retries, backoff):
+    """获取单个视频，临时错误按指数退避重试，返回 (title, transcript, attempts, title_error)
+
+    标题获取失败同样重试；重试用尽后使用默认标题，并在 title_error 中返回错误信息。
+    最终失败时抛出最后一次的异常，并在异常的 attempts 属性中记录实际尝试次数。
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            title, transcript = fetch_video(video_id, languages, limiter, strict_title=True)
+            return title, transcript, attempt, None
+        except PERMANENT_ERRORS as e:
+            e.attempts = attempt
+            raise
+        except Exception as e:
+            if attempt > retries:
+                if isinstance(e, TitleFetchError):
+                    # 标题失败时字幕已经获取成功并已缓存
+                    return DEFAULT_TITLE, get_transcript(video_id, languages, limiter), attempt, str(e)
+                e.attempts = attempt
+                raise
+            # 指数退避并加入随机抖动，避免并发任务同时重试
+            time.sleep(backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.5))
+
+
+def convert_youtube_batch(videos, output_dir, languages=DEFAULT_LANGUAGES, concurrency=4,
+                          rate=2.0, retries=3, backoff=1.0):
+    """批量转换视频 ID 或 URL 列表（例如播放列表导出）
+
+    每个视频写入 output_dir/<video_id>.md，并生成 index.md 索引。
+    concurrency 限制同时进行的视频数，rate 是每个主机每秒的最大请求数。
+    返回包含吞吐量和失败信息的统计字典；title_failures 记录只能使用默认标题的视频。
+    """
+    video_ids = []
+    invalid = []
+    for item in videos:
+        video_id = extract_video_id(item)
+        if not video_id:
+            invalid.append(item)
+        elif video_id not in video_ids:
+            video_ids.append(video_id)
+
+    os.makedirs(output_dir, exist_ok=True)
+    limiter = HostRateLimiter(rate)
+    results = {}
+    failures = {item: "无效的YouTube视频" for item in invalid}
+    title_failures = {}
+    total_attempts = 0
+    started_at = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="youtube-batch") as pool:
+        futures = {
+            pool.submit(_fetch_with_retry, video_id, languages, limiter, retries, backoff): video_id
+            for video_id in video_ids
+        }
+        for future in as_completed(futures):
+            video_id = futures[future]
+            try:
+                title, transcript, attempts, title_error = future.result()
+            except Exception as e:
+                failures[video_id] = str(e) or type(e).__name__
+                total_attempts += getattr(e, "attempts", 1)
+                continue
+            total_attempts += attempts
+            if title_error:
+                title_failures[video_id] = title_error
+            with open(os.path.join(output_dir, f"{video_id}.md"), "w", encoding="utf-8") as f:
+                f.write(build_markdown(title, transcript))
+            results[video_id] = title
+
+    # 按输入顺序生成索引
+    index = ["# YouTube 视频索引\n\n"]
+    for video_id in video_ids:
+        if video_id in results:
+            index.append(f"- [{results[video_id]}]({video_id}.md)\n")
+    if failures:
+        index.append("\n## 转换失败\n\n")
+        for item, error in failures.items():
+            index.append(f"- {item}: {error}\n")
+    with open(os.path.join(output_dir, "index.md"), "w", encoding="utf-8") as f:
+        f.write("".join(index))
+
+    elapsed = time.monotonic() - started_at
+    return {
+        "total": len(video_ids) + len(invalid),
+        "succeeded": len(results),
+        "failed": len(failures),
+        "retries": total_attempts - len(video_ids),
+        "elapsed_seconds": round(elapsed, 2),
+        "videos_per_minute": round(len(results) / elapsed * 60, 2) if elapsed else 0.0,
+        "failures": failures,
+        "title_failures": title_failures,
+    }
+
+
+def read_video_list(path):
+    """读取视频列表文件：每行一个视频 ID 或 URL，忽略空行和 # 开头的注释"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python youtube_converter.py <video_id>", file=sys.stderr)
+    parser = argparse.ArgumentParser(description="Convert YouTube transcripts to Markdown")
+    parser.add_argument("video", nargs="?", help="视频 ID 或 URL（单个视频，输出到标准输出）")
+    parser.add_argument("--batch", help="批量模式：包含视频 ID 或 URL 的列表文件，每行一个")
+    parser.add_argument("--output-dir", "-o", default="youtube_markdown", help="批量模式的输出目录")
+    parser.add_argument("--concurrency", type=int, default=4, help="批量模式的并发数（默认: 4）")
+    parser.add_argument("--rate", type=float, default=2.0, help="每个主机每秒最大请求数（默认: 2）")
+    parser.add_argument("--retries", type=int, default=3, help="临时错误的重试次数（默认: 3）")
+    args = parser.parse_args()
+
+    if args.batch:
+        stats = convert_youtube_batch(
+            read_video_list(args.batch),
+            args.output_dir,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            retries=args.retries
+        )
+        print(f"完成: {stats['succeeded']}/{stats['total']} 个视频, 失败 {stats['failed']} 个, "
+              f"重试 {stats['retries']} 次, 耗时 {stats['elapsed_seconds']} 秒, "
+              f"{stats['videos_per_minute']} 个/分钟")
+        for video_id, error in stats["title_failures"].items():
+            print(f"警告: {video_id}: {error}，已使用默认标题", file=sys.stderr)
+        for item, error in stats["failures"].items():
+            print(f"失败: {item}: {error}", file=sys.stderr)
+        sys.exit(1 if stats["failed"] else 0)
+
+    if not args.video:
+        parser.print_usage(sys.stderr)
+        sys.exit(1)
+
+    video_id = extract_video_id(args.video)
+    if not video_id:
+        print(f"Error: 无效的YouTube视频: {args.video}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        markdown = convert_youtube_to_markdown(video_id)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
         sys.exit(1)
-    
-    video_id = sys.argv[1]
-    markdown = convert_youtube_to_markdown(video_id)
-    print(markdown) 
\ No newline at end of file
+    print(markdown)
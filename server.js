@@ -338,28 +338,24 @@ app.post('/convert-video', upload.single('video'), async (req, res) => {
             }
         });
 
-        let output = '';
+        let pending = '';
         let errorOutput = '';
 
-        // 处理Python进程的输出
+        // 处理Python进程的输出：每行一个 JSON 事件（progress/segment/result/error）
         pythonProcess.stdout.on('data', (data) => {
-            const outputStr = data.toString();
-            try {
-                // 尝试解析JSON输出
-                const jsonData = JSON.parse(outputStr);
-                if (jsonData.type === 'progress') {
-                    // 进度信息只发送到进度条
-                    res.write(`data: ${outputStr}\n\n`);
-                } else if (jsonData.type === 'complete') {
-                    // 音频转换文本发送到输出框
-                    output = jsonData.content;
-                    res.write(`data: ${outputStr}\n\n`);
+            pending += data.toString();
+            const lines = pending.split('\n');
+            pending = lines.pop();
+
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                try {
+                    JSON.parse(line);
+                    res.write(`data: ${line}\n\n`);
+                } catch (e) {
+                    // 非 JSON 的输出（例如第三方库的打印）只记录日志
+                    console.log('Python output:', line);
                 }
-            } catch (e) {
-                // 如果不是JSON，则作为普通文本处理
-                // 这种情况通常是从Python脚本直接打印的文本输出
-                output = outputStr;
-                res.write(`data: ${JSON.stringify({ type: 'complete', content: outputStr })}\n\n`);
             }
         });
 
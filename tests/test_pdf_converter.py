@@ -0,0 +1,76 @@
+import os
+import sys
+import random
+
+import pytest
+
+pdfplumber = pytest.importorskip("pdfplumber")
+pytest.importorskip("reportlab")
+from reportlab.pdfgen import canvas
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from converters import pdf_converter
+
+
+def make_pdf(path, draw):
+    """用 reportlab 生成单页 PDF，draw 接收 canvas 负责绘制内容"""
+    c = canvas.Canvas(str(path), pagesize=(600, 800))
+    draw(c)
+    c.showPage()
+    c.save()
+    return path
+
+
+def process_first_page(path):
+    with pdfplumber.open(str(path)) as pdf:
+        page = pdf.pages[0]
+        return pdf_converter.find_table_regions(page), pdf_converter.process_page(page, 'markdown')
+
+
+def test_ruled_table_becomes_markdown_table(tmp_path):
+    def draw(c):
+        c.drawString(100, 700, "Intro")
+        xs, ys = [100, 200, 300, 400], [600, 580, 560, 540]
+        for y in ys:
+            c.line(xs[0], y, xs[-1], y)
+        for x in xs:
+            c.line(x, ys[0], x, ys[-1])
+        for r, y in enumerate(ys[:-1]):
+            for col, x in enumerate(xs[:-1]):
+                c.drawString(x + 5, y - 15, f"r{r}c{col}")
+
+    regions, text = process_first_page(make_pdf(tmp_path / "table.pdf", draw))
+
+    assert len(regions) == 1
+    assert text.startswith("# Intro\n\n|")
+    assert "| r0c0 | r0c1 | r0c2 |\n| --- | --- | --- |\n| r1c0 | r1c1 | r1c2 |" in text
+
+
+def test_single_box_is_not_a_table(tmp_path):
+    def draw(c):
+        c.rect(100, 500, 300, 100)
+        c.drawString(120, 560, "Boxed note")
+
+    regions, text = process_first_page(make_pdf(tmp_path / "box.pdf", draw))
+
+    assert regions == []
+    assert "Boxed note" in text
+    assert "|" not in text
+
+
+def test_overlapping_markers_are_not_tables(tmp_path):
+    rng = random.Random(0)
+
+    def draw(c):
+        c.drawString(100, 750, "Scatter plot")
+        for _ in range(400):
+            c.rect(rng.uniform(100, 500), rng.uniform(100, 700), 6, 6, fill=1)
+        for _ in range(200):
+            c.rect(rng.uniform(100, 500), rng.uniform(100, 700), 6, 6)
+
+    regions, text = process_first_page(make_pdf(tmp_path / "scatter.pdf", draw))
+
+    assert regions == []
+    assert "Scatter plot" in text
+    assert "|" not in text
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("pdfplumber")
+pytest.importorskip("reportlab")
+from reportlab.pdfgen import canvas
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from converters import spool
+
+
+def make_pdf(path, page_texts):
+    """生成每页一行文字的 PDF"""
+    c = canvas.Canvas(str(path), pagesize=(600, 800))
+    for text in page_texts:
+        c.drawString(100, 400, text)
+        c.showPage()
+    c.save()
+    return str(path)
+
+
+def test_workers_convert_shards_and_results_merge_in_order(tmp_path):
+    first = make_pdf(tmp_path / "first.pdf", [f"first page {i}" for i in range(5)])
+    second = make_pdf(tmp_path / "second.pdf", ["second page 0"])
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+
+    job_id = spool.submit_job(str(spool_dir), [first, second], shard_pages=2)
+
+    # 第一次调用领取并处理所有分片，之后的调用没有可领取的分片
+    counts = [spool.run_worker(str(spool_dir), exit_when_idle=True) for _ in range(3)]
+    assert counts == [4, 0, 0]
+
+    results = spool.collect_results(str(spool_dir), job_id, timeout=0)
+
+    text = results[first]
+    positions = [text.index(f"first page {i}") for i in range(5)]
+    assert positions == sorted(positions)
+    assert "second page 0" in results[second]
+    assert "second page" not in text
+    assert os.path.exists(spool_dir / job_id / spool.COMPLETE_MARKER)
+
+
+def test_requeue_expired_uses_job_lease(tmp_path):
+    source = make_pdf(tmp_path / "doc.pdf", ["page 0", "page 1"])
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    job_id = spool.submit_job(str(spool_dir), [source], shard_pages=1, lease_seconds=60)
+    job_dir = str(spool_dir / job_id)
+
+    (_, stale_path), (_, fresh_path) = spool.claim_shard(job_dir), spool.claim_shard(job_dir)
+    backdated = time.time() - 61
+    os.utime(stale_path, (backdated, backdated))
+
+    assert spool.requeue_expired(job_dir) == 1
+    assert os.listdir(os.path.join(job_dir, "pending")) == [os.path.basename(stale_path)]
+    assert os.listdir(os.path.join(job_dir, "claimed")) == [os.path.basename(fresh_path)]
+
+
+def test_shard_fails_after_max_attempts(tmp_path):
+    source = make_pdf(tmp_path / "doc.pdf", ["page 0"])
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    job_id = spool.submit_job(str(spool_dir), [source])
+    # 提交后源文件不可访问，每次转换都会出错
+    os.remove(source)
+
+    assert spool.run_worker(str(spool_dir), exit_when_idle=True) == spool.MAX_SHARD_ATTEMPTS
+
+    with pytest.raises(spool.ShardFailedError) as excinfo:
+        spool.collect_results(str(spool_dir), job_id, timeout=0)
+    assert list(excinfo.value.failures) == ["0000-000000"]
+    assert os.listdir(spool_dir / job_id / "pending") == []
+    assert os.listdir(spool_dir / job_id / "claimed") == []
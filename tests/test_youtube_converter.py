@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("youtube_transcript_api")
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from converters import youtube_converter
+
+
+class StandInYouTube(BaseHTTPRequestHandler):
+    """本地替身服务器：提供 oEmbed、watch 页面和 timedtext 接口
+
+    failures 记录 (路径, 视频 ID) 还需要返回错误的次数，用于模拟临时错误；
+    no_captions 中的视频返回没有字幕的 watch 页面。
+    """
+
+    requests_seen = []
+    delay = 0
+    failures = {}
+    no_captions = set()
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        self.requests_seen.append(parsed.path)
+        time.sleep(self.delay)
+
+        video_id = query["v"][0] if "v" in query else parse_qs(urlparse(query["url"][0]).query)["v"][0]
+        key = (parsed.path, video_id)
+        if self.failures.get(key, 0) > 0:
+            self.failures[key] -= 1
+            self.send_error(429 if parsed.path == "/oembed" else 500)
+            return
+
+        if parsed.path == "/oembed":
+            self._send("application/json", json.dumps({"title": f"标题 {video_id}"}))
+        elif parsed.path == "/watch" and video_id in self.no_captions:
+            self._send("text/html", '<html>"playabilityStatus":{}</html>')
+        elif parsed.path == "/watch":
+            captions = {
+                "playerCaptionsTracklistRenderer": {
+                    "captionTracks": [{
+                        "baseUrl": f"https://www.youtube.com/api/timedtext?v={query['v'][0]}&lang=en",
+                        "name": {"simpleText": "English"},
+                        "languageCode": "en",
+                    }],
+                }
+            }
+            self._send("text/html", '<html>"captions":' + json.dumps(captions) + ',"videoDetails":{}</html>')
+        elif parsed.path == "/api/timedtext":
+            self._send("text/xml", '<transcript>'
+                                   '<text start="0.5" dur="2.0">hello</text>'
+                                   '<text start="65.0" dur="1.5">world</text>'
+                                   '</transcript>')
+        else:
+            self.send_error(404)
+
+    def _send(self, content_type, body):
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    StandInYouTube.requests_seen = []
+    StandInYouTube.delay = 0
+    StandInYouTube.failures = {}
+    StandInYouTube.no_captions = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInYouTube)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(youtube_converter, "OEMBED_URL", f"{base_url}/oembed")
+    monkeypatch.setattr(youtube_converter, "TRANSCRIPT_BASE_URL", base_url)
+    youtube_converter._title_cache.clear()
+    youtube_converter._transcript_cache.clear()
+    yield StandInYouTube
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_convert_uses_stand_in_server_and_caches(stand_in):
+    markdown = youtube_converter.convert_youtube_to_markdown("abc123", languages=("en",))
+
+    assert markdown == (
+        "# 标题 abc123\n\n"
+        "## 视频字幕\n\n"
+        "**00:00** hello\n\n"
+        "**01:05** world\n\n"
+    )
+    assert sorted(stand_in.requests_seen) == ["/api/timedtext", "/oembed", "/watch"]
+
+    # 第二次转换完全命中缓存，不再发出请求
+    assert youtube_converter.convert_youtube_to_markdown("abc123", languages=("en",)) == markdown
+    assert len(stand_in.requests_seen) == 3
+
+
+def test_transcript_request_times_out(stand_in, monkeypatch):
+    import requests
+
+    stand_in.delay = 1
+    monkeypatch.setattr(youtube_converter, "REQUEST_TIMEOUT", (0.2, 0.2))
+
+    with pytest.raises(requests.Timeout):
+        youtube_converter.get_transcript("slow", languages=("en",))
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.hosts = []
+
+    def wait(self, host):
+        self.hosts.append(host)
+
+
+def test_limiter_gates_every_request(stand_in):
+    limiter = RecordingLimiter()
+
+    youtube_converter.fetch_video("abc123", languages=("en",), limiter=limiter)
+
+    # oEmbed、watch 页面和 timedtext 各一次
+    assert len(limiter.hosts) == len(stand_in.requests_seen) == 3
+    assert len(set(limiter.hosts)) == 1
+
+
+def test_batch_counts_real_attempts(stand_in, tmp_path):
+    # 第一次 watch 请求返回 500，重试时发现视频没有字幕（永久错误）
+    stand_in.failures = {("/watch", "nocap"): 1}
+    stand_in.no_captions = {"nocap"}
+
+    stats = youtube_converter.convert_youtube_batch(
+        ["nocap", "abc123"], str(tmp_path), languages=("en",), rate=0, backoff=0.01
+    )
+
+    assert stats["succeeded"] == 1
+    assert list(stats["failures"]) == ["nocap"]
+    assert stats["retries"] == 1
+
+
+def test_batch_retries_title_errors(stand_in, tmp_path):
+    stand_in.failures = {("/oembed", "abc123"): 1, ("/oembed", "busy"): 10}
+
+    stats = youtube_converter.convert_youtube_batch(
+        ["abc123", "busy"], str(tmp_path), languages=("en",), rate=0, retries=2, backoff=0.01
+    )
+
+    assert stats["succeeded"] == 2
+    assert stats["retries"] == 1 + 2
+    assert (tmp_path / "abc123.md").read_text(encoding="utf-8").startswith("# 标题 abc123")
+    # 重试用尽后使用默认标题，并在统计中报告
+    assert list(stats["title_failures"]) == ["busy"]
+    assert (tmp_path / "busy.md").read_text(encoding="utf-8").startswith(f"# {youtube_converter.DEFAULT_TITLE}")
+    # 字幕已缓存，标题重试不会重复请求字幕
+    assert stand_in.requests_seen.count("/watch") == 2
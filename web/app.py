@@ -3,16 +3,16 @@ import sys
 import argparse
 from flask import Flask, render_template, request, send_file, jsonify
 from werkzeug.utils import secure_filename
-import requests
-from youtube_transcript_api import YouTubeTranscriptApi
 
 # 添加项目根目录到 Python 路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from converters.pdf_converter import convert_pdf_to_text
+from converters.pdf_converter import convert_pdf
+from converters.youtube_converter import extract_video_id, fetch_video, build_markdown
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads'))
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['CONVERSION_DEADLINE_SECONDS'] = 60  # 单次转换的最长时间，超时返回部分结果
 
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -41,15 +41,28 @@ def convert():
         if not os.path.exists(full_path):
             return jsonify({'error': f'文件不存在: {full_path}'}), 404
         
-        # 转换文件
-        text = convert_pdf_to_text(full_path)
+        # 转换文件，超过时间或页数上限时返回已转换的部分
+        try:
+            deadline_seconds = min(
+                float(data.get('deadline_seconds') or app.config['CONVERSION_DEADLINE_SECONDS']),
+                app.config['CONVERSION_DEADLINE_SECONDS']
+            )
+            max_pages = int(data['max_pages']) if data.get('max_pages') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'deadline_seconds 和 max_pages 必须是数字'}), 400
+        result = convert_pdf(full_path, deadline_seconds=deadline_seconds, max_pages=max_pages)
+        if result['error']:
+            return jsonify({'error': f"转换失败: {result['error']}", 'truncation': result['truncation']}), 500
+        # 在提取到任何文本之前就到期时，返回空文本和截断信息
+        text = result['text'] or ''
         
         # 如果是纯文本格式，移除所有 Markdown 标记
         if format_type == 'text':
             text = text.replace('#', '').replace('*', '').replace('`', '')
         
         return jsonify({
-            'text': text
+            'text': text,
+            'truncation': result['truncation']
         })
         
     except Exception as e:
@@ -89,37 +102,20 @@ def convert_youtube():
         url = data['url']
         
         # 从URL中提取视频ID
-        if 'youtube.com' in url:
-            video_id = url.split('v=')[1].split('&')[0]
-        elif 'youtu.be' in url:
-            video_id = url.split('/')[-1]
-        else:
+        if 'youtube.com' not in url and 'youtu.be' not in url:
+            return jsonify({'error': '无效的YouTube URL'}), 400
+        video_id = extract_video_id(url)
+        if not video_id:
             return jsonify({'error': '无效的YouTube URL'}), 400
         
-        # 获取视频标题
-        try:
-            response = requests.get(f'https://www.youtube.com/oembed?url={url}&format=json')
-            video_info = response.json()
-            title = video_info['title']
-        except:
-            title = "YouTube Video"
-        
-        # 获取视频字幕
+        # 并发获取视频标题和字幕（带缓存）
         try:
-            transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=['zh', 'en'])
+            title, transcript = fetch_video(video_id)
         except Exception as e:
             return jsonify({'error': f'无法获取视频字幕: {str(e)}'}), 400
         
         # 构建Markdown内容
-        markdown = f"# {title}\n\n"
-        markdown += "## 视频字幕\n\n"
-        
-        for entry in transcript:
-            start_time = int(entry['start'])
-            minutes = start_time // 60
-            seconds = start_time % 60
-            timestamp = f"{minutes:02d}:{seconds:02d}"
-            markdown += f"**{timestamp}** {entry['text']}\n\n"
+        markdown = build_markdown(title, transcript)
         
         return jsonify({
             'text': markdown